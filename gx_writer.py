@@ -0,0 +1,356 @@
+# Author: Urself25 (Modified for OrcaSlicer)
+# Date: March 2, 2025
+# Description: Post-processing script for OrcaSlicer to convert G-code to FlashForge-compatible GX files in-place.
+#              Shared by the single and dual extruder entry points.
+# License: GPLv3
+
+import struct
+import base64
+import hashlib
+import mmap
+import sys
+import os
+import re
+from PIL import Image
+from io import BytesIO
+
+# "1h 2m 3s" style durations from the slicer's time estimate
+_TIME_RE = re.compile(rb"(\d+)([hms])")
+_TIME_UNITS = {b"h": 3600, b"m": 60, b"s": 1}
+
+# Executable block marker and the tool selection written after it, per extruder layout.
+# The dual extruder marker keeps the spelling its script has always matched.
+SINGLE_EXTRUDER_SETUP = (b"; Executable_block_start", b"T0 ; Set primary extruder\n")
+DUAL_EXTRUDER_SETUP = (b"; Executable_black_start", b"T0 ; Set first extruder\nT1 ; Set second extruder\n")
+
+def _find_line_end(data, text, start=0):
+    """Return the offset just past the first line of data from start on equal to text, or -1."""
+    start = data.find(text, start)
+    while start != -1:
+        line_start = data.rfind(b"\n", 0, start) + 1
+        line_end = data.find(b"\n", start)
+        line_end = len(data) if line_end == -1 else line_end + 1
+        if data[line_start:line_end].strip() == text:
+            return line_end
+        start = data.find(text, line_end)
+    return -1
+
+def _iter_lines(data, start=0):
+    """Yield each line of data from offset start onwards with the offset of the line after it."""
+    size = len(data)
+    while start < size:
+        end = data.find(b"\n", start)
+        end = size if end == -1 else end + 1
+        yield data[start:end].rstrip(b"\r\n"), end
+        start = end
+
+def _iter_lines_reversed(data):
+    """Yield the lines of data back to front without splitting the whole buffer."""
+    end = len(data) - 1 if data[-1:] == b"\n" else len(data)
+    while end >= 0:
+        start = data.rfind(b"\n", 0, end) + 1
+        yield data[start:end].rstrip(b"\r")
+        end = start - 1
+
+BMP_WIDTH, BMP_HEIGHT = 80, 60
+
+def _encode_bmp(pixels):
+    """Encode packed 80x60 RGB pixels as the bottom-up 24-bit BMP embedded in GX files."""
+    row_size = BMP_WIDTH * 3  # 240 bytes, already a multiple of 4 so rows need no padding
+    image_size = row_size * BMP_HEIGHT
+    header = struct.pack("<2sIHHI", b"BM", 54 + image_size, 0, 0, 54)
+    header += struct.pack("<IiiHHIIiiII", 40, BMP_WIDTH, BMP_HEIGHT, 1, 24, 0, image_size, 3780, 3780, 0, 0)
+    bgr = bytearray(pixels)
+    bgr[0::3], bgr[2::3] = pixels[2::3], pixels[0::3]
+    rows = (bgr[y * row_size:(y + 1) * row_size] for y in reversed(range(BMP_HEIGHT)))
+    return header + b"".join(rows)
+
+_BLANK_BMP = _encode_bmp(b"\xff" * (BMP_WIDTH * BMP_HEIGHT * 3))
+
+# Converted previews keyed by a hash of the source PNG, so reslicing the same model skips the decode
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "orca_gx_thumb")
+# Hashed into every cache key; change it whenever the PNG to BMP conversion changes so stale
+# previews are not served
+THUMBNAIL_CACHE_VERSION = b"v3:rgb-bilinear:"
+
+def _load_cached_bmp(key):
+    """Return the cached preview BMP for key, or None if it is missing or unreadable."""
+    try:
+        with open(os.path.join(THUMBNAIL_CACHE_DIR, key + ".bmp"), "rb") as file:
+            bmp = file.read()
+    except OSError:
+        return None
+    return bmp if len(bmp) == len(_BLANK_BMP) else None
+
+def _store_cached_bmp(key, bmp):
+    """Save a converted preview BMP; the cache is best effort, so failures are ignored."""
+    try:
+        os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+        with open(os.path.join(THUMBNAIL_CACHE_DIR, key + ".bmp"), "wb") as file:
+            file.write(bmp)
+    except OSError:
+        pass
+
+def _write_all(fd, data):
+    """Write data to fd with unbuffered os.write calls, retrying short writes."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _write_parts(fd, parts):
+    """Write parts to fd in order, as a single gather write where os.writev is available."""
+    if not hasattr(os, "writev"):
+        for part in parts:
+            _write_all(fd, part)
+        return
+    views = [memoryview(part) for part in parts]
+    while views:
+        written = os.writev(fd, views)
+        # Drop the fully written parts and resume a short write where it stopped
+        while views and written >= views[0].nbytes:
+            written -= views.pop(0).nbytes
+        if views:
+            views[0] = views[0][written:]
+
+class GXWriter:
+    def __init__(self, gcode_path, dual_extruder=False):
+        self.gcode_path = gcode_path
+        self.dual_extruder = dual_extruder
+        self.extruder_marker, self.extruder_select = DUAL_EXTRUDER_SETUP if dual_extruder else SINGLE_EXTRUDER_SETUP
+        self.bmp = None
+        self.raw = None
+        self.extruder_offset = -1
+        self.thumbnail_base64 = bytearray()
+        self.thumbnail_found = False
+        self.print_time = 0
+        self.filament_usage = 0
+        self.filament_usage_left = 0  # Only filled in for dual extruder
+        self.layer_height = 0
+        self.print_speed = 60
+        self.bed_temp = 0
+        self.print_temp = 0
+        self.print_temp_left = 0  # Only filled in for dual extruder
+        self.multi_extruder_type = 1 if dual_extruder else 0
+        
+        self.load_gcode()
+        self.extract_metadata()
+        self.bmp = self.extract_and_convert_thumbnail() or self.generate_blank_bmp()
+    
+    def load_gcode(self):
+        """Load G-code from the provided file."""
+        try:
+            with open(self.gcode_path, "rb") as file:
+                # Map the file instead of reading it, so scans and the final write use the page cache directly
+                if os.fstat(file.fileno()).st_size:
+                    self.raw = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self.raw = b""
+        except Exception as e:
+            print(f"Error loading G-code: {e}")
+            self.raw = b""
+    
+    def extract_metadata(self):
+        """Extract metadata and the base64 thumbnail from the G-code comment blocks."""
+        remaining = set(self._METADATA_PARSERS)
+        # The slicer writes its header and thumbnail as comments at the top of the file
+        # and its settings as comments at the bottom, so only those blocks are scanned.
+        # The settings block is read back to front first, so as when every line was parsed
+        # in order, the last occurrence of a field wins and overrides the header.
+        for line in _iter_lines_reversed(self.raw):
+            if not remaining or (line.strip() and not line.startswith(b';')):
+                break
+            remaining.discard(self._parse_metadata_line(line, remaining))
+        # The executable block marker is picked up while walking the top block.
+        header_end = self._scan_comments(0, remaining)
+        if self.extruder_offset == -1:
+            # Ensure the extruders are selected after the executable block marker; the lines are
+            # spliced in when the GX file is written
+            self.extruder_offset = _find_line_end(self.raw, self.extruder_marker, header_end)
+
+        # Fall back to searching the whole file for anything the comment blocks did not
+        # provide, with bytes.find/rfind doing the scanning instead of a per-line loop.
+        # An unterminated block has already been collected by the header scan
+        if not self.thumbnail_found and not self.thumbnail_base64:
+            start = self.raw.find(b"thumbnail begin")
+            if start != -1:
+                start = self.raw.rfind(b"\n", 0, start) + 1
+                self._scan_comments(start, set())
+        for key in list(remaining):
+            # The last occurrence wins, as it did when every line was parsed in order
+            start = self.raw.rfind(b"\n; " + key + b" =")
+            if start != -1:
+                end = self.raw.find(b"\n", start + 1)
+                line = self.raw[start + 1:end] if end != -1 else self.raw[start + 1:]
+                remaining.discard(self._parse_metadata_line(line.rstrip(b"\r"), remaining))
+
+    def _scan_comments(self, start, remaining):
+        """Parse comment lines from offset start until every field in remaining and the thumbnail
+        are found or G-code commands begin, and return the offset where parsing stopped; if that
+        is inside a thumbnail block with no end line, return where the block began instead.
+        A field repeated within the block takes its last value."""
+        inside_thumbnail_block = False
+        thumbnail_start = start
+        found = set()
+        for line, end in _iter_lines(self.raw, start):
+            if not remaining and self.thumbnail_found:
+                break
+            if inside_thumbnail_block:
+                if b"thumbnail end" in line:
+                    inside_thumbnail_block = False
+                    self.thumbnail_found = True
+                else:
+                    # Thumbnail payload lines are always "; <base64>"
+                    self.thumbnail_base64.extend(line[2:].strip())
+            elif not self.thumbnail_found and b"thumbnail begin" in line:
+                inside_thumbnail_block = True
+                thumbnail_start = start
+            elif line.startswith(b';'):
+                if self.extruder_offset == -1 and line.strip() == self.extruder_marker:
+                    self.extruder_offset = end
+                else:
+                    found.add(self._parse_metadata_line(line, remaining))
+            elif line.strip():
+                break
+            start = end
+        remaining -= found
+        return thumbnail_start if inside_thumbnail_block else start
+
+    def _parse_metadata_line(self, line, wanted):
+        """Parse a "; key = value" comment if key is in wanted, returning the key or None."""
+        key, sep, value = line[1:].partition(b'=')
+        key = key.strip()
+        if sep and key in wanted:
+            self._METADATA_PARSERS[key](self, value.strip())
+            return key
+        return None
+
+    def _parse_print_time(self, value):
+        self.print_time = sum(int(amount) * _TIME_UNITS[unit] for amount, unit in _TIME_RE.findall(value))
+
+    def _parse_filament_usage(self, value):
+        values = value.split(b',')
+        self.filament_usage = int(float(values[0].strip()))
+        if self.dual_extruder and len(values) > 1:
+            self.filament_usage_left = int(float(values[1].strip()))
+
+    def _parse_layer_height(self, value):
+        self.layer_height = int(float(value) * 1000)
+
+    def _parse_print_speed(self, value):
+        # When normal and silent mode limits are both listed, the silent one is used
+        values = value.split(b',')
+        self.print_speed = int(values[1 if len(values) > 1 else 0].strip())
+
+    def _parse_bed_temp(self, value):
+        self.bed_temp = int(value)
+
+    def _parse_print_temp(self, value):
+        temps = value.split(b',')
+        self.print_temp = int(temps[0])
+        if self.dual_extruder and len(temps) > 1:
+            self.print_temp_left = int(temps[1])
+
+    # Slicer comment keys ("; key = value") mapped to the parser for their value
+    _METADATA_PARSERS = {
+        b'estimated printing time (normal mode)': _parse_print_time,
+        b'filament used [mm]': _parse_filament_usage,
+        b'layer_height': _parse_layer_height,
+        b'machine_max_speed_x': _parse_print_speed,
+        b'first_layer_bed_temperature': _parse_bed_temp,
+        b'nozzle_temperature': _parse_print_temp,
+    }
+    
+    def extract_and_convert_thumbnail(self):
+        """Extract PNG thumbnail from G-code and convert it to BMP format."""
+        if self.thumbnail_base64:
+            try:
+                png_data = base64.b64decode(self.thumbnail_base64)
+                cache_key = hashlib.sha1(THUMBNAIL_CACHE_VERSION + png_data).hexdigest()
+                bmp = _load_cached_bmp(cache_key)
+                if bmp is None:
+                    # Drop alpha before resampling so transparent pixels keep their stored colour;
+                    # previews the slicer already rendered at 80x60 need no resampling at all
+                    png_image = Image.open(BytesIO(png_data)).convert("RGB")
+                    if png_image.size != (BMP_WIDTH, BMP_HEIGHT):
+                        png_image = png_image.resize((BMP_WIDTH, BMP_HEIGHT), Image.BILINEAR, reducing_gap=2.0)
+                    bmp = _encode_bmp(png_image.tobytes())
+                    _store_cached_bmp(cache_key, bmp)
+                return bmp
+            except Exception as e:
+                print(f"Error extracting or converting thumbnail: {e}")
+        return None
+
+    def generate_blank_bmp(self):
+        """Generate a blank BMP image in case no thumbnail is found."""
+        return _BLANK_BMP
+    
+    def encode_gx_parts(self):
+        """Generate the pieces of the binary GX file format, in file order."""
+        if self.raw is None or self.bmp is None:
+            print("Error: Missing G-code or BMP thumbnail.")
+            return None
+        
+        return [
+            b"xgcode 1.0\n\0",
+            struct.pack("<4i", 0, 58, 14512, 14512),
+            struct.pack("<iiih", max(self.print_time, 1), self.filament_usage, self.filament_usage_left, self.multi_extruder_type),
+            struct.pack("<8h", self.layer_height, 0, 2, self.print_speed, self.bed_temp, self.print_temp, self.print_temp_left, 1),
+            self.bmp,
+        ] + self.gcode_parts()
+
+    def gcode_parts(self):
+        """Return the G-code as views into the loaded file, with the extruder selection spliced in."""
+        gcode = memoryview(self.raw)
+        if self.extruder_offset == -1:
+            return [gcode]
+        return [gcode[:self.extruder_offset], self.extruder_select, gcode[self.extruder_offset:]]
+
+    def encode_gx(self):
+        """Generate the binary GX file format."""
+        parts = self.encode_gx_parts()
+        return b"".join(parts) if parts else None
+    
+    def save_gx(self):
+        """Replace the original G-code file with the GX format."""
+        gx_parts = self.encode_gx_parts()
+        if gx_parts:
+            temp_path = self.gcode_path + ".tmp"
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                # Write the pieces as they are rather than joining them into one large buffer
+                _write_parts(fd, gx_parts)
+                os.fsync(fd)
+                if hasattr(os, "posix_fadvise"):
+                    # The GX file goes to the printer next, so don't keep it in the page cache
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+                # Release the views into the mapped G-code so the mapping can be closed
+                for part in gx_parts:
+                    if isinstance(part, memoryview):
+                        part.release()
+            self.close()
+            os.replace(temp_path, self.gcode_path)
+            print(f"G-code successfully converted to GX format: {self.gcode_path}")
+        else:
+            print("Failed to generate GX file.")
+
+    def close(self):
+        """Unmap the G-code file; Windows will not replace a file that is still mapped."""
+        if isinstance(self.raw, mmap.mmap):
+            self.raw.close()
+            self.raw = None
+
+def main(dual_extruder=False):
+    """Convert the G-code file named on the command line in place."""
+    if len(sys.argv) != 2:
+        print(f"Usage: python {os.path.basename(sys.argv[0])} input.gcode")
+        sys.exit(1)
+    
+    input_gcode = sys.argv[1]
+    
+    writer = GXWriter(input_gcode, dual_extruder)
+    writer.save_gx()
+
+if __name__ == "__main__":
+    main()